@@ -33,26 +33,98 @@ All of the heavy lifting and communications with the Spotify API are
 done using the excellent spotipy library.
 """
 
+import atexit
+import hashlib
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import urlparse, parse_qs
+from queue import Empty, SimpleQueue
+from urllib.parse import unquote_plus
 
+import requests
 import spotipy
+import urllib3
 
 SCOPE = "user-read-playback-state,user-modify-playback-state"
 CACHE_PATH = ".cast_token_cache"
 QUEUE_PATH = ".cast_queue"
+QUEUE_LOCK = threading.Lock()  # Makes checking and adding to QUEUED_URIS atomic
 ADMIN_PREFIX = os.getenv("CAST_ADMIN_PREFIX", default="ADMIN")
+ADMIN_PREFIX_LEN = len(ADMIN_PREFIX)
 
 CLIENT_ID = os.getenv("CAST_CLIENT_ID")
 CLIENT_SECRET = os.getenv("CAST_CLIENT_SECRET")
 if not CLIENT_ID or not CLIENT_SECRET:
     raise ValueError("Environment variables CAST_CLIENT_ID and CAST_CLIENT_SECRET must be set")
 
-CAST_PORT = os.getenv("CAST_PORT", default="3141")
+CAST_PORT = int(os.getenv("CAST_PORT", default="3141"))
+CAST_MAX_WORKERS = int(os.getenv("CAST_MAX_WORKERS", default="16"))
+CAST_CACHE_TTL = int(os.getenv("CAST_CACHE_TTL", default="18000"))
+CAST_LOG = bool(os.getenv("CAST_LOG"))
 CAST_REDIRECT_PORT = os.getenv("CAST_REDIRECT_PORT", default="9999")
 REDIRECT_URI = f"http://localhost:{CAST_REDIRECT_PORT}"
 
+# Built once and shared by every request, rather than reconstructed (and
+# the cache file re-read) on each GET. The token info is kept in memory,
+# and only written back to the cache file when it changes. The lock
+# serialises token refreshes, since requests are handled on concurrent
+# threads.
+TOKEN_FILE = spotipy.cache_handler.CacheFileHandler(cache_path=CACHE_PATH)
+TOKEN_CACHE = spotipy.cache_handler.MemoryCacheHandler(token_info=TOKEN_FILE.get_cached_token())
+_SAVED_TOKEN_INFO = {"token_info": TOKEN_CACHE.get_cached_token()}
+AUTH_MANAGER = spotipy.oauth2.SpotifyOAuth(
+    scope=SCOPE,
+    cache_handler=TOKEN_CACHE,
+    client_id=CLIENT_ID,
+    client_secret=CLIENT_SECRET,
+    redirect_uri=REDIRECT_URI,
+    open_browser=True,
+)
+TOKEN_LOCK = threading.Lock()
+TOKEN_EXPIRY_MARGIN = 60  # Seconds before expiry at which requests refresh
+TOKEN_REFRESH_AHEAD = 120  # Seconds before expiry at which the refresher does
+TOKEN_REFRESH_POLL = 30  # Seconds between the refresher's checks
+_CACHED_TOKEN = {"token": None, "expires_at": 0}
+
+# A single client, so its requests.Session (and hence any kept-alive
+# HTTPS connection to the Spotify API) is reused between requests. The
+# session's connection pool is sized to the worker pool, so every worker
+# can keep its own connection alive rather than having it discarded (as
+# happens past spotipy's default pool size of 10). The retry policy is
+# the same as the one spotipy would have used.
+SPOTIFY_SESSION = requests.Session()
+SPOTIFY_SESSION.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(
+        pool_maxsize=CAST_MAX_WORKERS,
+        max_retries=urllib3.Retry(
+            total=spotipy.client.Spotify.max_retries,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            status=spotipy.client.Spotify.max_retries,
+            backoff_factor=0.3,
+            status_forcelist=spotipy.client.Spotify.default_retry_codes,
+        ),
+    ),
+)
+SPOTIFY = spotipy.client.Spotify(requests_session=SPOTIFY_SESSION, requests_timeout=5)
+
+# Searches currently in flight, keyed by normalised track name, so that
+# identical searches made at the same time share one Spotify API call.
+# Recent results are also kept (for CAST_CACHE_TTL seconds, or only
+# briefly if nothing was found), in least-recently-used order, so
+# repeated searches don't go back to Spotify at all.
+SEARCH_LOCK = threading.Lock()
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_NOT_FOUND_TTL = min(60, CAST_CACHE_TTL)  # Seconds
+_PENDING_SEARCHES = {}
+_SEARCH_CACHE = OrderedDict()
+
 SEARCH_FORM = """
 <form id="form1">
     <label for="search">Search:</label><br>
@@ -61,26 +133,172 @@ SEARCH_FORM = """
 
 <button type="submit" form="form1" value="Submit">Submit</button>
 """
+SEARCH_FORM_BYTES = SEARCH_FORM.encode()
+# The form's "search" field, wherever it appears among the parameters
+SEARCH_QUERY_RE = re.compile(r"(?:^|&)search=([^&]*)")
+TRACK_INFO = "{title}:<br>Song: {name}<br>Artist: {artist}<br>Album: {album}<br><br>"
+HELLO_BYTES = b"Hello!"
+# The landing page never changes, so browsers may reuse their copy.
+LANDING_PAGE_ETAG = f'"{hashlib.sha1(HELLO_BYTES + SEARCH_FORM_BYTES).hexdigest()}"'
 
 
-def is_queued(track):
-    """Check the queue file to see if a given URI has been queued.
-    In an ideal world, Spotify will update their API to allow users to
-    search the queue, but for the time being, we have to check a file
-    that we update manually. This functionality may change (and may be
-    moved inside the CastHTTPRequestHandler class) if this functionality
-    is ever provided.
-    """
+def load_queued_uris():
+    """Read the queue file, and return the set of URIs already queued."""
     try:
-        with open(QUEUE_PATH, "r") as queue:
-            data = queue.read().splitlines()
+        # Only the (ASCII) URIs matter here, so don't choke on track names
+        # written in another encoding by older versions of CAST.
+        with open(QUEUE_PATH, "r", encoding="utf-8", errors="replace") as queue:
+            return {line.partition(" ")[0] for line in queue if line.strip()}
     except FileNotFoundError:
-        data = []
-    for item in data:
-        uri, _, _ = item.split(" ", maxsplit=2)
-        if uri == track["uri"]:
-            return True
-    return False
+        return set()
+
+
+def describe_track(title, track):
+    """Return a short HTML description of a track, under the given title."""
+    return TRACK_INFO.format(
+        title=title,
+        name=track["name"],
+        artist=track["artists"][0]["name"],
+        album=track["album"]["name"],
+    )
+
+
+def claim_queue_slot(track):
+    """Mark a track as queued, returning False if it already was.
+    In an ideal world, Spotify will update their API to allow users to
+    search the queue, but for the time being, we have to keep track of
+    what we've queued ourselves. The queue file is read into QUEUED_URIS
+    once at startup, and both are updated as tracks are queued. This
+    functionality may change (and may be moved inside the
+    CastHTTPRequestHandler class) if this functionality is ever provided.
+
+    The check and the add happen together under QUEUE_LOCK, so of several
+    requests for the same track at once, only one goes on to queue it.
+    If queuing then fails, the caller should release_queue_slot().
+    """
+    with QUEUE_LOCK:
+        if track["uri"] in QUEUED_URIS:
+            return False
+        QUEUED_URIS.add(track["uri"])
+        return True
+
+
+def release_queue_slot(track):
+    """Forget a track claimed with claim_queue_slot() that couldn't be
+    queued after all, so it can be tried again.
+    """
+    with QUEUE_LOCK:
+        QUEUED_URIS.discard(track["uri"])
+
+
+def write_queue_records():
+    """Append records put on QUEUE_RECORDS to the queue file, until a
+    None is received. Run on a background thread, so handlers never wait
+    on the file. Whatever has built up since the last write is written
+    together, looping in case write() to QUEUE_FD takes only part of it.
+    If the write fails the error is printed and that batch is dropped,
+    but the thread carries on with the next one.
+    """
+    running = True
+    while running:
+        records = [QUEUE_RECORDS.get()]
+        while True:
+            try:
+                records.append(QUEUE_RECORDS.get_nowait())
+            except Empty:
+                break
+        if None in records:
+            running = False
+            records = [record for record in records if record is not None]
+        data = "".join(records).encode("utf-8")
+        while data:
+            try:
+                written = os.write(QUEUE_FD, data)
+            except OSError as exc:
+                print(exc)
+                break
+            data = data[written:]
+
+
+def stop_queue_writer():
+    """Write out any records still waiting, and stop the writer thread."""
+    QUEUE_RECORDS.put(None)
+    QUEUE_WRITER.join()
+
+
+QUEUED_URIS = load_queued_uris()
+# Kept open for the lifetime of the server, rather than reopened for
+# every track queued. O_APPEND makes each write land at the end of the
+# file atomically, with no buffering of our own to flush.
+QUEUE_FD = os.open(QUEUE_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+QUEUE_RECORDS = SimpleQueue()
+QUEUE_WRITER = threading.Thread(target=write_queue_records, daemon=True)
+QUEUE_WRITER.start()
+atexit.register(os.close, QUEUE_FD)
+atexit.register(stop_queue_writer)  # Runs first, since atexit is LIFO
+
+
+def save_cached_token():
+    """Write the token info held in memory to the cache file, if it has
+    changed since it was last read or written, so the next run of CAST
+    can pick it up.
+    """
+    token_info = TOKEN_CACHE.get_cached_token()
+    if token_info is not None and token_info != _SAVED_TOKEN_INFO["token_info"]:
+        TOKEN_FILE.save_token_to_cache(token_info)
+        _SAVED_TOKEN_INFO["token_info"] = token_info
+
+
+def _use_token(token_info):
+    """Save new token info to the cache file, hand the access token to
+    the shared SPOTIFY client, and remember it in memory. Must be called
+    with TOKEN_LOCK held.
+    """
+    save_cached_token()
+    SPOTIFY.set_auth(token_info["access_token"])
+    _CACHED_TOKEN["token"] = token_info["access_token"]
+    _CACHED_TOKEN["expires_at"] = token_info["expires_at"]
+    return token_info["access_token"]
+
+
+def get_token():
+    """Return a valid access token, only going to the auth manager (and
+    possibly Spotify) when the token held in memory is missing or within
+    TOKEN_EXPIRY_MARGIN seconds of expiring. The shared SPOTIFY client
+    is handed each new token as it arrives, and new tokens are saved to
+    the cache file.
+    """
+    if _CACHED_TOKEN["expires_at"] - time.time() > TOKEN_EXPIRY_MARGIN:
+        return _CACHED_TOKEN["token"]
+    with TOKEN_LOCK:
+        # Another thread may have refreshed the token while we waited
+        if _CACHED_TOKEN["expires_at"] - time.time() > TOKEN_EXPIRY_MARGIN:
+            return _CACHED_TOKEN["token"]
+        # Spins up a tiny webserver if no cache exists
+        AUTH_MANAGER.get_access_token(as_dict=False)
+        return _use_token(AUTH_MANAGER.cache_handler.get_cached_token())
+
+
+def refresh_token_periodically():
+    """Refresh the access token TOKEN_REFRESH_AHEAD seconds before it
+    expires, so that requests (which only refresh it themselves within
+    TOKEN_EXPIRY_MARGIN seconds of expiry) never have to wait on Spotify
+    for a new one. Does nothing until the first request has logged in.
+    Intended to run forever on a background thread.
+    """
+    while True:
+        time.sleep(TOKEN_REFRESH_POLL)
+        if _CACHED_TOKEN["token"] is None:
+            continue
+        with TOKEN_LOCK:
+            if _CACHED_TOKEN["expires_at"] - time.time() > TOKEN_REFRESH_AHEAD:
+                continue
+            try:
+                refresh_token = TOKEN_CACHE.get_cached_token()["refresh_token"]
+                _use_token(AUTH_MANAGER.refresh_access_token(refresh_token))
+            except Exception as exc:  # pylint: disable=broad-except
+                # Requests will still refresh the token themselves
+                print(exc)
 
 
 class CastHTTPRequestHandler(BaseHTTPRequestHandler):
@@ -89,18 +307,87 @@ class CastHTTPRequestHandler(BaseHTTPRequestHandler):
     this. If it breaks then welp.
     """
 
+    # The base classes give each handler a __dict__ regardless, but our
+    # own per-request attribute can still live in a slot.
+    __slots__ = ("client_ip",)
+
+    # Buffer the response, so the status line, headers and page go out
+    # together when the request is finished, rather than as one send()
+    # for the headers and another for the body.
+    wbufsize = -1
+    # Seconds a connection may sit idle (e.g. a browser preconnect that
+    # never sends a request) before it's dropped, freeing its worker.
+    timeout = 20
+
     def __init__(self, request, client_address, server):
         # IP/port of requester can be accessed with self.client_address
         self.client_ip = client_address[0]
-        self.spotify_ctx = None
         super().__init__(request, client_address, server)
 
-    def _write_page(self, premsg=b""):
-        """Helper function to write the basic HTML page, with a
-        prepended string if desired."""
-        if premsg:
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Only log requests to stderr if the environment variable
+        CAST_LOG is set, saving a write (and flush) on every request
+        otherwise."""
+        if CAST_LOG:
+            super().log_message(format, *args)
+
+    def _write_page(self, premsg=b"", cacheable=False, headers_only=False):
+        """Helper function to write the response headers and the basic
+        HTML page, with a prepended string if desired. Since wfile is
+        buffered, the message and form don't need joining to go out in
+        a single send. If cacheable, the browser is allowed to keep the
+        page for a few minutes. If headers_only, the page itself isn't
+        written (e.g. for HEAD requests)."""
+        self.send_response(200)
+        self.send_header("Content-type", "text/html")
+        self.send_header("Content-Length", str(len(premsg) + len(SEARCH_FORM_BYTES)))
+        if cacheable:
+            self.send_header("Cache-Control", "public, max-age=300")
+            self.send_header("ETag", LANDING_PAGE_ETAG)
+        self.end_headers()
+        if not headers_only:
             self.wfile.write(premsg)
-        self.wfile.write(SEARCH_FORM.encode())
+            self.wfile.write(SEARCH_FORM_BYTES)
+
+    def _parse_search(self):
+        """Work out what a request for self.path is asking for. Returns
+        None if it should get a 404, the empty string for the landing
+        page, or otherwise the search text. Shared by do_GET() and
+        do_HEAD(), so the two always agree.
+        """
+        path, _, query = self.path.partition("?")
+        # Turn away anything but the main page (e.g. the favicon.ico
+        # request browsers make with every page load) before doing any
+        # token work.
+        if path != "/":
+            return None
+        if not query:
+            return ""
+
+        # Submitting the form empty sends "search=", which (as with no
+        # query at all) just gets the landing page.
+        match = SEARCH_QUERY_RE.search(query)
+        if match is None:
+            return None
+        return unquote_plus(match.group(1))
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        """Respond to HTTP HEAD request. This never searches or queues
+        anything, and does no token work. Anything GET would serve the
+        landing page for gets the landing page's headers, and a real
+        search gets bare headers, since we can't know what a GET would
+        return without doing the search. Anything GET would 404 does
+        here too.
+        """
+        search = self._parse_search()
+        if search is None:
+            self.send_error(404)
+        elif not search:
+            self._write_page(premsg=HELLO_BYTES, cacheable=True, headers_only=True)
+        else:
+            self.send_response(200)
+            self.send_header("Content-type", "text/html")
+            self.end_headers()
 
     def do_GET(self):  # pylint: disable=invalid-name
         """Respond to HTTP GET request.
@@ -115,61 +402,88 @@ class CastHTTPRequestHandler(BaseHTTPRequestHandler):
         the first time the app is used, since after that we'll have
         cached tokens.
         """
-        parts = urlparse(self.path)
-        path = parts.path
-        if path == "/":
-            query_string = parse_qs(parts.query)
-            cache_handler = spotipy.cache_handler.CacheFileHandler(cache_path=CACHE_PATH)
-            auth_manager = spotipy.oauth2.SpotifyOAuth(
-                scope=SCOPE,
-                cache_handler=cache_handler,
-                client_id=CLIENT_ID,
-                client_secret=CLIENT_SECRET,
-                redirect_uri=REDIRECT_URI,
-                open_browser=True,
-            )
-            # Spins up a tiny webserver if no cache exists
-            token = auth_manager.get_access_token(as_dict=False)
-
-            # If here, then we have valid auth tokens
-            if not query_string:
-                self.send_response(200)
-                self.send_header("Content-type", "text/html")
-                self.end_headers()
-                self._write_page(premsg="Hello!".encode())
+        search = self._parse_search()
+        if search is None:
+            self.send_error(404)
+            return
+
+        # A browser revalidating a landing page it already has must have
+        # got it after we logged in, so it needs no token work at all.
+        if not search and self.headers.get("If-None-Match") == LANDING_PAGE_ETAG:
+            self.send_response(304)
+            self.send_header("ETag", LANDING_PAGE_ETAG)
+            self.end_headers()
+            return
+
+        get_token()
+
+        # If here, then we have valid auth tokens
+        if not search:
+            self._write_page(premsg=HELLO_BYTES, cacheable=True)
+        else:
+            if search.startswith(ADMIN_PREFIX):
+                output = self.admin_control(search[ADMIN_PREFIX_LEN:])
             else:
-                try:
-                    search = query_string["search"][0]
-                except KeyError:
-                    self.send_response(404)
-                    return
-
-                self.spotify_ctx = spotipy.client.Spotify(auth=token)
-                if search.startswith(ADMIN_PREFIX):
-                    output = self.admin_control(search.removeprefix(ADMIN_PREFIX))
-                else:
-                    output = self.search_and_queue(search)
-                self.send_response(200)
-                self.send_header("Content-type", "text/html")
-                self.end_headers()
-                self._write_page(premsg=output.encode())
+                output = self.search_and_queue(search)
+            self._write_page(premsg=output.encode())
 
-    def _search_track(self, track_name):
-        """Search for a track, and return a track object if found,
-        or None if not.
+    def _fetch_track(self, track_name):
+        """Search Spotify for a track, and return a track object if
+        found, or None if not.
         """
-        search = self.spotify_ctx.search(track_name, type="track", limit=1)
+        search = SPOTIFY.search(track_name, type="track", limit=1)
         if search["tracks"]["total"] == 0:
             return None
         return search["tracks"]["items"][0]
 
+    def _search_track(self, track_name):
+        """Search for a track, and return a track object if found,
+        or None if not. Recent results are served from _SEARCH_CACHE,
+        and if the same search is already in flight from another
+        request, wait for its result rather than asking Spotify again.
+        Waiters all get the same track back at once, so callers must
+        claim it with claim_queue_slot() rather than check, then queue.
+        """
+        key = track_name.strip().casefold()
+        with SEARCH_LOCK:
+            cached = _SEARCH_CACHE.get(key)
+            if cached is not None:
+                track, expires_at = cached
+                if time.time() < expires_at:
+                    _SEARCH_CACHE.move_to_end(key)
+                    return track
+                del _SEARCH_CACHE[key]
+            future = _PENDING_SEARCHES.get(key)
+            in_flight = future is not None
+            if not in_flight:
+                future = _PENDING_SEARCHES[key] = Future()
+        if in_flight:
+            return future.result()
+
+        try:
+            track = self._fetch_track(track_name)
+        except Exception as exc:  # pylint: disable=broad-except
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(track)
+            ttl = CAST_CACHE_TTL if track is not None else SEARCH_CACHE_NOT_FOUND_TTL
+            with SEARCH_LOCK:
+                _SEARCH_CACHE[key] = (track, time.time() + ttl)
+                if len(_SEARCH_CACHE) > SEARCH_CACHE_SIZE:
+                    _SEARCH_CACHE.popitem(last=False)
+        finally:
+            with SEARCH_LOCK:
+                del _PENDING_SEARCHES[key]
+        return track
+
     def _queue_track(self, track):
-        """Queue a track. Adds to the Spotify queue, and updates the
-        queue file with the new track.
+        """Queue a track. Adds to the Spotify queue, and hands the new
+        track to the writer thread to add to the queue file.
         """
-        self.spotify_ctx.add_to_queue(track["uri"])
-        with open(QUEUE_PATH, "a") as queue:
-            queue.write(f"{track['uri']} {self.client_ip} {track['name']}{os.linesep}")
+        SPOTIFY.add_to_queue(track["uri"])
+        QUEUED_URIS.add(track["uri"])  # Already there, unless forced
+        QUEUE_RECORDS.put(f"{track['uri']} {self.client_ip} {track['name']}\n")
 
     def search_and_queue(self, track_name, check_queue=True):
         """Search Spotify with the desired track name, and add the first
@@ -179,65 +493,131 @@ class CastHTTPRequestHandler(BaseHTTPRequestHandler):
         if track is None:
             return f"No results found for {track_name}.<br><br>"
 
-        if check_queue and is_queued(track):
+        if check_queue and not claim_queue_slot(track):
             return f"{track['name']} has already been queued.<br><br>"
 
         try:
             self._queue_track(track)
-            return_string = (
-                f"Queued:<br>"
-                f"Song: {track['name']}<br>"
-                f"Artist: {track['artists'][0]['name']}<br>"
-                f"Album: {track['album']['name']}<br><br>"
-            )
+            return_string = describe_track("Queued", track)
         except spotipy.exceptions.SpotifyException as exc:
+            if check_queue:
+                release_queue_slot(track)
             print(exc)
             return_string = "Error queuing track - possibly no active device?<br><br>"
         return return_string
 
+    def _admin_pause(self):
+        """Pause the playback."""
+        SPOTIFY.pause_playback()
+        return "Playback paused."
+
+    def _admin_current(self):
+        """Get info about the track currently playing."""
+        track = SPOTIFY.currently_playing()["item"]
+        return describe_track("Currently playing", track)
+
+    def _admin_skip(self):
+        """Skip to the next track."""
+        SPOTIFY.next_track()
+        return "Skipped to next track."
+
+    def _admin_resume(self):
+        """Resume the playback after being paused."""
+        SPOTIFY.start_playback()
+        return "Playback resumed."
+
+    def _admin_queue(self, track_name):
+        """Add a track to the queue, even if already queued."""
+        return self.search_and_queue(track_name, check_queue=False)
+
+    def _admin_force(self, track_name):
+        """Immediately play a track, interrupting the current track."""
+        track = self._search_track(track_name)
+        if not track:
+            return f"Failed to find track {track_name}"
+        SPOTIFY.start_playback(uris=[track["uri"]])
+        return f"Forcing playback of {track['name']}"
+
+    # Admin actions, looked up by name. Those in _ADMIN_ARG_ACTIONS take
+    # the rest of the command (e.g. "queue foo") as their argument.
+    _ADMIN_ACTIONS = {
+        "pause": _admin_pause,
+        "current": _admin_current,
+        "skip": _admin_skip,
+        "next": _admin_skip,
+        "resume": _admin_resume,
+        "play": _admin_resume,
+    }
+    _ADMIN_ARG_ACTIONS = {
+        "queue": _admin_queue,
+        "force": _admin_force,
+    }
+
     def admin_control(self, arg):
         """Perform one of a limited set of actions (other than queuing).
         Options are: pause
                      current
                      skip
                      resume
-                     force (add to queue even if already queued)
+                     queue (add to queue even if already queued)
+                     force (immediately play a track)
         """
         arg = arg.lower().strip()
-        # Note: In Python 3.10, maybe use pattern-matching here?
-        if arg == "pause":
-            self.spotify_ctx.pause_playback()
-            response = "Playback paused."
-        elif arg == "current":
-            track = self.spotify_ctx.currently_playing()["item"]
-            response = (
-                f"Currently playing:<br>"
-                f"Song: {track['name']}<br>"
-                f"Artist: {track['artists'][0]['name']}<br>"
-                f"Album: {track['album']['name']}<br><br>"
-            )
-        elif arg in ("skip", "next"):
-            self.spotify_ctx.next_track()
-            response = "Skipped to next track."
-        elif arg in ("resume", "play"):
-            self.spotify_ctx.start_playback()
-            response = "Playback resumed."
-        elif arg.startswith("queue "):  # Force queue even if song already queued.
-            response = self.search_and_queue(arg[6:], check_queue=False)
-        elif arg.startswith("force "):  # Immediately play track, interrupting current track.
-            track = self._search_track(arg[6:])
-            if not track:
-                response = f"Failed to find track {arg[6:]}"
-            else:
-                self.spotify_ctx.start_playback(uris=[track["uri"]])
-                response = f"Forcing playback of {track['name']}"
-        else:
-            response = f"Unrecognised admin action: {arg}"
-        return response
+        action = self._ADMIN_ACTIONS.get(arg)
+        if action is not None:
+            return action(self)
+        name, _, track_name = arg.partition(" ")
+        action = self._ADMIN_ARG_ACTIONS.get(name)
+        if action is not None and track_name:
+            return action(self, track_name)
+        return f"Unrecognised admin action: {arg}"
+
+
+class CastHTTPServer(ThreadingHTTPServer):
+    """A ThreadingHTTPServer that hands requests to a fixed pool of
+    worker threads, rather than spawning a new thread per connection.
+    This saves the cost of creating a thread for every request, and
+    caps how many requests can hit the Spotify API at once.
+    """
+
+    # Room for a burst of connections (e.g. everyone scanning a QR code at
+    # once) to wait for the accept loop, rather than having SYNs dropped.
+    request_queue_size = 4096
+
+    def __init__(self, server_address, handler_class, max_workers=CAST_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.pending = SimpleQueue()
+        # Daemon threads, like ThreadingHTTPServer's, so a worker stuck on
+        # a slow connection never holds up shutdown.
+        for _ in range(max_workers):
+            threading.Thread(target=self._serve_pending, daemon=True).start()
+        super().__init__(server_address, handler_class)
+
+    def _serve_pending(self):
+        """Handle requests from self.pending until a None is received."""
+        while (item := self.pending.get()) is not None:
+            self.process_request_thread(*item)
+
+    def process_request(self, request, client_address):
+        self.pending.put((request, client_address))
+
+    def server_close(self):
+        super().server_close()
+        # Drop any requests not yet picked up, and stop idle workers
+        # without waiting for busy ones.
+        while True:
+            try:
+                item = self.pending.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                self.shutdown_request(item[0])
+        for _ in range(self.max_workers):
+            self.pending.put(None)
 
 
 if __name__ == "__main__":
-    server_address = ("", int(CAST_PORT))
-    httpd = ThreadingHTTPServer(server_address, CastHTTPRequestHandler)
+    httpd = CastHTTPServer(("", CAST_PORT), CastHTTPRequestHandler)
+    threading.Thread(target=refresh_token_periodically, daemon=True).start()
     print(f"Starting CAST server on localhost, port {CAST_PORT}.")
     httpd.serve_forever()